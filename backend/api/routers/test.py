@@ -2,7 +2,7 @@ from fastapi import APIRouter, HTTPException, Body
 from pydantic import BaseModel
 from typing import List, Literal
 from services import tmdb_service, emby_service, rule_service
-from core.constants import COUNTRY_CODE_MAP # 导入国家代码中文映射
+from core.constants import COUNTRY_CODE_MAP, LANG_TO_COUNTRY_MAP # 导入国家代码中文映射
 
 router = APIRouter(prefix="/test", tags=["Tests"])
 
@@ -96,10 +96,11 @@ async def test_emby_write(request: EmbyWriteRequest = Body(...)):
             elif "TagItems" in item:
                 original_tags = [t.get('Name') for t in item["TagItems"] if t.get('Name')]
             
+            # sorted() 可以直接消费集合，无需先拷贝成列表
             if request.mode == 'merge':
-                final_tags = sorted(list(set(original_tags + request.tags)))
+                final_tags = sorted(set(original_tags).union(request.tags))
             else: # overwrite
-                final_tags = sorted(list(set(request.tags)))
+                final_tags = sorted(set(request.tags))
             
             updated_items_details.append({
                 "id": item_id,
@@ -163,15 +164,7 @@ async def test_full_flow_preview(request: FullFlowRequest = Body(...)):
     if not countries:
         original_language = details.get('original_language')
         if original_language:
-            # 简单的语言到国家映射
-            lang_to_country_map = {
-                "en": "US", "zh": "CN", "ja": "JP", "ko": "KR",
-                "fr": "FR", "de": "DE", "es": "ES", "it": "IT",
-                "hi": "IN", "ar": "SA", "pt": "BR", "ru": "RU",
-                "th": "TH", "sv": "SE", "da": "DK", "no": "NO",
-                "nl": "NL", "pl": "PL",
-            }
-            mapped_country = lang_to_country_map.get(original_language)
+            mapped_country = LANG_TO_COUNTRY_MAP.get(original_language)
             if mapped_country:
                 countries = [mapped_country]
 
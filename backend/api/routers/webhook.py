@@ -2,7 +2,7 @@ from fastapi import APIRouter, HTTPException, Body
 from typing import Dict, Any
 import asyncio
 from services import config_service, tmdb_service, rule_service, emby_service
-import json
+from core import jsonutil
 import logging
 from asyncio import Queue
 
@@ -61,15 +61,17 @@ async def _process_webhook_payload(payload: Dict[Any, Any]):
         genre_ids = [genre['id'] for genre in details.get('genres', [])]
         countries = [country['iso_3166_1'] for country in details.get('production_countries', [])]
         
+        # 提取年份：直接切前 4 位，不用 split 构造整段列表
+        # (与 emby_service.py / test.py 的提取逻辑保持一致)
         media_year = None
         if item_type == 'Movie':
             release_date = details.get('release_date')
-            if release_date:
-                media_year = int(release_date.split('-')[0])
+            if release_date and len(release_date) >= 4:
+                media_year = int(release_date[:4])
         elif item_type == 'Series':
             first_air_date = details.get('first_air_date')
-            if first_air_date:
-                media_year = int(first_air_date.split('-')[0])
+            if first_air_date and len(first_air_date) >= 4:
+                media_year = int(first_air_date[:4])
 
         logger.info(f"提取的 TMDB 信息: Genres={genre_ids}, Countries={countries}, Year={media_year}")
         
@@ -121,12 +123,13 @@ async def receive_webhook(token: str, payload: Dict[Any, Any] = Body(...)):
 
     # 2. 记录接收到的数据
     logger.info("--- 收到有效的 Webhook 请求 ---")
-    try:
-        pretty_payload = json.dumps(payload, indent=2, ensure_ascii=False)
-        logger.debug(pretty_payload)
-    except Exception as e:
-        logger.error(f"无法格式化为 JSON，记录原始数据: {e}")
-        logger.debug(payload)
+    # 只在 DEBUG 级别启用时才序列化 payload，避免每次通知都白做一遍格式化
+    if logger.isEnabledFor(logging.DEBUG):
+        try:
+            logger.debug(jsonutil.dumps(payload, indent=True))
+        except Exception as e:
+            logger.error(f"无法格式化为 JSON，记录原始数据: {e}")
+            logger.debug(payload)
     
     # 3. 检查自动化是否启用 (这里只检查是否需要入队，实际处理中会再次检查)
     automation_enabled = webhook_config.get('automation_enabled', 'false').lower() == 'true'
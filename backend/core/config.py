@@ -56,6 +56,10 @@ config.read(CONFIG_FILE_PATH, encoding='utf-8')
 EMBY_SERVER_URL = config.get('EMBY', 'server_url', fallback=None)
 EMBY_API_KEY = config.get('EMBY', 'api_key', fallback=None)
 EMBY_USER_ID = config.get('EMBY', 'user_id', fallback=None)
+# 更新标签时是否回传完整的 item JSON。Emby 的更新端点普遍按整体
+# 替换处理，默认回传完整数据；确认所用版本接受部分更新后，可将此项
+# 设为 false 只发送标签相关字段以减小请求体
+EMBY_SEND_FULL_ITEM = config.get('EMBY', 'send_full_item', fallback='true').lower() == 'true'
 
 # --- TMDB 配置 ---
 TMDB_API_KEY = config.get('TMDB', 'api_key', fallback=None)
@@ -63,3 +63,14 @@ COUNTRY_CODE_MAP = {
     "TH": "泰国",
     "SA": "沙特阿拉伯"
 }
+
+# TMDB original_language 到国家代码的回退映射
+# 当 TMDB 详情中没有 origin_country / production_countries 时，
+# 用原始语言推断一个国家，供规则匹配使用
+LANG_TO_COUNTRY_MAP = {
+    "en": "US", "zh": "CN", "ja": "JP", "ko": "KR",
+    "fr": "FR", "de": "DE", "es": "ES", "it": "IT",
+    "hi": "IN", "ar": "SA", "pt": "BR", "ru": "RU",
+    "th": "TH", "sv": "SE", "da": "DK", "no": "NO",
+    "nl": "NL", "pl": "PL",
+}
@@ -0,0 +1,25 @@
+# JSON 编解码的统一入口。
+# 优先使用 orjson（C 实现，大体量 Emby 响应的解析/序列化比标准库快数倍），
+# 未安装时自动回退到标准库 json，调用方接口保持一致。
+try:
+    import orjson
+
+    def loads(data):
+        """解析 JSON（接受 bytes 或 str）"""
+        return orjson.loads(data)
+
+    def dumps(obj, indent: bool = False) -> str:
+        """序列化为 JSON 字符串（非 ASCII 字符不转义）"""
+        option = orjson.OPT_INDENT_2 if indent else 0
+        return orjson.dumps(obj, option=option).decode('utf-8')
+
+except ImportError:
+    import json as _json
+
+    def loads(data):
+        """解析 JSON（接受 bytes 或 str）"""
+        return _json.loads(data)
+
+    def dumps(obj, indent: bool = False) -> str:
+        """序列化为 JSON 字符串（非 ASCII 字符不转义）"""
+        return _json.dumps(obj, ensure_ascii=False, indent=2 if indent else None)
@@ -86,4 +86,8 @@ async def shutdown_event():
             await app.state.webhook_consumer_task
         except asyncio.CancelledError:
             logger.info("Webhook 消费者任务已取消。")
+
+    # 释放 Emby 共享 Session 的连接池
+    from services import emby_service
+    emby_service.close_session()
     logger.info("应用已关闭。")
@@ -1,70 +1,114 @@
 import configparser
+import io
+import os
+import re
 import secrets
 from core.config import CONFIG_FILE_PATH
 
+def _write_config_atomic(config: configparser.ConfigParser):
+    """
+    将 configparser 对象原子性地写入配置文件。
+    先在内存中构造完整内容，一次性写入临时文件并 fsync，
+    再用 os.replace 原子替换，避免写入中途崩溃导致配置损坏。
+    """
+    buf = io.StringIO()
+    config.write(buf)
+    data = buf.getvalue().encode('utf-8')
+
+    tmp_path = CONFIG_FILE_PATH + '.tmp'
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, data)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, CONFIG_FILE_PATH)
+
+# 轻量级 INI 解析用的正则（配置文件只有几个简单的字符串选项，
+# 不需要 configparser 的插值和大小写转换等完整机制）
+_INI_SECTION_RE = re.compile(r'^\s*\[(?P<section>[^\]]+)\]\s*$')
+_INI_OPTION_RE = re.compile(r'^\s*(?P<key>[^;#\s][^=:]*?)\s*[=:]\s*(?P<value>.*?)\s*$')
+
+def _read_ini(path: str) -> dict:
+    """
+    用一次正则扫描读取 INI 文件，返回 {section: {key: value}} 字典。
+    语义与 configparser 保持一致：键名转为小写，忽略注释和空行。
+    """
+    sections: dict = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    except (FileNotFoundError, IOError):
+        return sections
+
+    current = None
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith(('#', ';')):
+            continue
+        m = _INI_SECTION_RE.match(line)
+        if m:
+            current = sections.setdefault(m.group('section'), {})
+            continue
+        m = _INI_OPTION_RE.match(line)
+        if m and current is not None:
+            current[m.group('key').lower()] = m.group('value')
+    return sections
+
 def get_config() -> dict:
     """
     读取配置文件并返回一个字典。
     如果 webhook 配置不存在，则自动生成并保存。
     """
-    config = configparser.ConfigParser()
-    config.read(CONFIG_FILE_PATH, encoding='utf-8')
+    config_dict = _read_ini(CONFIG_FILE_PATH)
 
     # --- Webhook 配置自动生成 ---
     needs_saving = False
-    if not config.has_section('WEBHOOK'):
-        config.add_section('WEBHOOK')
-        needs_saving = True
-    
-    if not config.has_option('WEBHOOK', 'enabled'):
-        config.set('WEBHOOK', 'enabled', 'false')
+    webhook = config_dict.setdefault('WEBHOOK', {})
+    if 'enabled' not in webhook:
+        webhook['enabled'] = 'false'
         needs_saving = True
 
-    if not config.has_option('WEBHOOK', 'secret_token'):
+    if 'secret_token' not in webhook:
         # 生成一个安全的随机 token
-        token = secrets.token_hex(32)
-        config.set('WEBHOOK', 'secret_token', token)
+        webhook['secret_token'] = secrets.token_hex(32)
         needs_saving = True
-        
-    if not config.has_option('WEBHOOK', 'delay_seconds'):
-        config.set('WEBHOOK', 'delay_seconds', '1') # 默认延迟1秒
+
+    if 'delay_seconds' not in webhook:
+        webhook['delay_seconds'] = '1' # 默认延迟1秒
         needs_saving = True
 
     # --- TMDB 限流配置自动生成 ---
-    if not config.has_section('TMDB'):
-        config.add_section('TMDB')
-        needs_saving = True
-    if not config.has_option('TMDB', 'rate_limit_period'):
-        config.set('TMDB', 'rate_limit_period', '1.0') # 默认1秒1次，0表示不限制
+    tmdb = config_dict.setdefault('TMDB', {})
+    if 'rate_limit_period' not in tmdb:
+        tmdb['rate_limit_period'] = '1.0' # 默认1秒1次，0表示不限制
         needs_saving = True
 
     # --- 登录配置自动生成 ---
-    if not config.has_section('LOGIN'):
-        config.add_section('LOGIN')
-        needs_saving = True
-    if not config.has_option('LOGIN', 'enabled'):
-        config.set('LOGIN', 'enabled', 'false')
+    login = config_dict.setdefault('LOGIN', {})
+    if 'enabled' not in login:
+        login['enabled'] = 'false'
         needs_saving = True
-    if not config.has_option('LOGIN', 'username'):
-        config.set('LOGIN', 'username', 'admin')
+    if 'username' not in login:
+        login['username'] = 'admin'
         needs_saving = True
-    if not config.has_option('LOGIN', 'password'):
-        config.set('LOGIN', 'password', 'password')
+    if 'password' not in login:
+        login['password'] = 'password'
         needs_saving = True
-    if not config.has_option('LOGIN', 'secret_key'):
-        config.set('LOGIN', 'secret_key', secrets.token_hex(32))
+    if 'secret_key' not in login:
+        login['secret_key'] = secrets.token_hex(32)
         needs_saving = True
 
     if needs_saving:
+        config = configparser.ConfigParser()
+        for section, values in config_dict.items():
+            config[section] = values
         try:
-            with open(CONFIG_FILE_PATH, 'w', encoding='utf-8') as configfile:
-                config.write(configfile)
+            _write_config_atomic(config)
             print("已自动生成并保存 Webhook/TMDB 限流配置。")
-        except IOError as e:
+        except (IOError, OSError) as e:
             print(f"自动保存 Webhook/TMDB 限流配置时出错: {e}")
-    
-    config_dict = {section: dict(config.items(section)) for section in config.sections()}
-    
+
     return config_dict
 
 def update_config(config_data: dict):
@@ -80,9 +124,11 @@ def update_config(config_data: dict):
         
     # 将更新后的配置写回文件
     try:
-        with open(CONFIG_FILE_PATH, 'w', encoding='utf-8') as configfile:
-            config.write(configfile)
+        _write_config_atomic(config)
+        # 配置变更后清除自动获取的 UserID 缓存，避免使用过期结果
+        from services import emby_service
+        emby_service.clear_user_id_cache()
         return True
-    except IOError as e:
+    except (IOError, OSError) as e:
         print(f"写入配置文件时出错: {e}")
         return False
@@ -1,17 +1,86 @@
 import requests
-import json
-from typing import List, Optional, Literal
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Literal, Set
+from urllib.parse import urlencode
 from core import config
+from core import jsonutil
+from core.constants import LANG_TO_COUNTRY_MAP
 import logging
 
 logger = logging.getLogger(__name__)
 
-def _get_headers():
-    """构造 Emby API 请求头"""
-    return {
-        'X-Emby-Token': config.EMBY_API_KEY,
-        'Content-Type': 'application/json',
-    }
+# 全库打标签时单项目处理的并发上限
+_TAGGING_CONCURRENCY = 16
+
+# 模块级共享 Session：复用 TCP/TLS 连接（keep-alive），避免为
+# 每个请求重新握手；批量任务（全库打标签/清理）对 Emby 发起
+# 数千次请求时，连接复用能显著降低总耗时。
+# 连接池按并发上限的倍数配置，保证并发打标签时不会因为默认的
+# pool_maxsize=10 把超出的请求串行化
+_SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=_TAGGING_CONCURRENCY * 2,
+    pool_maxsize=_TAGGING_CONCURRENCY * 4,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+)
+_SESSION.mount('http://', _adapter)
+_SESSION.mount('https://', _adapter)
+# 请求头在进程生命周期内不变（改 API Key 需要重启应用），直接挂到
+# Session 上，不再为每个请求构造一遍
+_SESSION.headers.update({
+    'X-Emby-Token': config.EMBY_API_KEY or '',
+    'Content-Type': 'application/json',
+})
+
+def close_session():
+    """关闭共享 Session，释放连接池（应用关闭时调用）"""
+    _SESSION.close()
+
+# 自动获取 UserID 的缓存。失败结果（None）同样缓存——负缓存，
+# 否则批量任务中每个项目都会重新请求一次 /emby/Users
+_USER_ID_UNSET = object() # 哨兵：表示尚未尝试获取
+_cached_auto_user_id = _USER_ID_UNSET
+_user_id_lock = threading.Lock()
+
+def _fetch_auto_user_id() -> Optional[str]:
+    """从 Emby API 自动获取第一个用户的 UserID（不带缓存）"""
+    print("配置中未指定 user_id，尝试自动获取...")
+    url = f"{config.EMBY_SERVER_URL}/emby/Users"
+    response = _SESSION.get(url, timeout=5)
+    response.raise_for_status()
+    users = jsonutil.loads(response.content)
+    if users:
+        user_id = users[0]['Id']
+        print(f"自动获取 UserID 成功: {user_id}")
+        return user_id
+    print("警告: Emby API 未返回任何用户，无法自动获取 UserID。")
+    return None
+
+def _resolve_auto_user_id() -> Optional[str]:
+    """带缓存地获取自动 UserID。双重检查加锁，保证并发下只请求一次"""
+    global _cached_auto_user_id
+    if _cached_auto_user_id is not _USER_ID_UNSET:
+        return _cached_auto_user_id
+    with _user_id_lock:
+        if _cached_auto_user_id is not _USER_ID_UNSET:
+            return _cached_auto_user_id
+        try:
+            user_id = _fetch_auto_user_id()
+        except requests.exceptions.RequestException as e:
+            print(f"自动获取 Emby UserID 时出错: {e}")
+            user_id = None
+        _cached_auto_user_id = user_id
+        return user_id
+
+def clear_user_id_cache():
+    """清除自动获取的 UserID 缓存（配置变更后调用）"""
+    global _cached_auto_user_id
+    with _user_id_lock:
+        _cached_auto_user_id = _USER_ID_UNSET
 
 def _get_user_id():
     """
@@ -23,25 +92,7 @@ def _get_user_id():
         return config.EMBY_USER_ID
 
     # 2. 如果配置中没有，则尝试自动获取（带缓存）
-    if hasattr(_get_user_id, "cached_auto_user_id"):
-        return _get_user_id.cached_auto_user_id
-
-    print("配置中未指定 user_id，尝试自动获取...")
-    url = f"{config.EMBY_SERVER_URL}/emby/Users"
-    try:
-        response = requests.get(url, headers=_get_headers(), timeout=5)
-        response.raise_for_status()
-        users = response.json()
-        if users:
-            user_id = users[0]['Id']
-            print(f"自动获取 UserID 成功: {user_id}")
-            _get_user_id.cached_auto_user_id = user_id
-            return user_id
-        print("警告: Emby API 未返回任何用户，无法自动获取 UserID。")
-        return None
-    except requests.exceptions.RequestException as e:
-        print(f"自动获取 Emby UserID 时出错: {e}")
-        return None
+    return _resolve_auto_user_id()
 
 def find_emby_items_by_tmdb_id(tmdb_id: str, item_type: str = "Movie,Series") -> List[dict]:
     """
@@ -65,22 +116,27 @@ def find_emby_items_by_tmdb_id(tmdb_id: str, item_type: str = "Movie,Series") ->
     }
     
     try:
-        response = requests.get(url, headers=_get_headers(), params=params)
+        response = _SESSION.get(url, params=params)
         response.raise_for_status()
-        data = response.json()
+        data = jsonutil.loads(response.content)
         
-        # 添加详细日志，打印 Emby API 返回的原始项目列表
-        logger.debug(f"find_emby_items_by_tmdb_id: Emby API 原始返回 {len(data.get('Items', []))} 个项目 (TMDB ID: {tmdb_id}, 查询类型: {item_type}).")
-        # 打印原始数据，确保即使日志消息过长也能看到
-        if data.get('Items'):
-            logger.debug(f"find_emby_items_by_tmdb_id: 原始数据详情: {json.dumps(data.get('Items', []), indent=2, ensure_ascii=False)}")
+        # 添加详细日志，打印 Emby API 返回的原始项目列表。
+        # 原始数据的序列化开销不小，只在 DEBUG 级别启用时才执行
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"find_emby_items_by_tmdb_id: Emby API 原始返回 {len(data.get('Items', []))} 个项目 (TMDB ID: {tmdb_id}, 查询类型: {item_type}).")
+            # 打印原始数据，确保即使日志消息过长也能看到
+            if data.get('Items'):
+                logger.debug(f"find_emby_items_by_tmdb_id: 原始数据详情: {jsonutil.dumps(data.get('Items', []), indent=True)}")
         
-        # API 可能返回多个结果，需要精确匹配 TMDB ID
+        # API 可能返回多个结果，需要精确匹配 TMDB ID。
+        # 比较用的字符串和类型集合在循环外构造一次，避免每个项目重复转换
+        tmdb_id_str = str(tmdb_id)
+        valid_types = set(item_type.split(','))
         exact_matches = []
         for item in data.get('Items', []):
             provider_ids = item.get('ProviderIds', {})
             # 确保 TMDB ID 匹配，并且项目类型在请求的 item_type 中
-            if str(provider_ids.get('Tmdb')) == str(tmdb_id) and item.get('Type') in item_type.split(','):
+            if str(provider_ids.get('Tmdb')) == tmdb_id_str and item.get('Type') in valid_types:
                 exact_matches.append(item)
         
         logger.debug(f"find_emby_items_by_tmdb_id: 精确匹配到 {len(exact_matches)} 个项目 (TMDB ID: {tmdb_id}, 查询类型: {item_type})。")
@@ -89,10 +145,68 @@ def find_emby_items_by_tmdb_id(tmdb_id: str, item_type: str = "Movie,Series") ->
         logger.error(f"查找 Emby 项目时出错 (TMDB ID: {tmdb_id}): {e}")
         return []
 
+# 单次 AnyProviderIdEquals 查询中合并的 TMDB ID 数量上限
+_PROVIDER_ID_BATCH_SIZE = 50
+
+def find_emby_items_by_tmdb_ids(tmdb_ids: List[str], item_type: str = "Movie,Series", max_workers: int = 16) -> Dict[str, List[dict]]:
+    """
+    批量查找多个 TMDB ID 对应的 Emby 媒体项目。
+    使用 AnyProviderIdEquals 将最多 50 个 ID 合并为一次查询
+    （Emby 支持 "tmdb.<id>,tmdb.<id2>" 形式），多个批次再经线程池
+    并发，把 N 次小请求压缩为 N/50 次。
+    :return: {tmdb_id: [匹配的项目列表]}
+    """
+    if not tmdb_ids:
+        return {}
+    if not config.EMBY_SERVER_URL:
+        logger.error("错误: EMBY_SERVER_URL 未配置")
+        return {tid: [] for tid in tmdb_ids}
+
+    url = f"{config.EMBY_SERVER_URL}/emby/Items"
+    valid_types = set(item_type.split(','))
+    # 响应按 ProviderIds.Tmdb 归入各自的桶；键保留调用方传入的原值
+    results: Dict[str, List[dict]] = {tid: [] for tid in tmdb_ids}
+    id_lookup = {str(tid): tid for tid in tmdb_ids}
+
+    def _fetch_batch(batch: List[str]) -> List[dict]:
+        params = {
+            'api_key': config.EMBY_API_KEY,
+            'Recursive': 'true',
+            'IncludeItemTypes': item_type,
+            'Fields': 'ProviderIds,Tags,TagItems,LockedFields,Type',
+            'AnyProviderIdEquals': ','.join(f'tmdb.{tid}' for tid in batch),
+        }
+        try:
+            response = _SESSION.get(url, params=params)
+            response.raise_for_status()
+            return jsonutil.loads(response.content).get('Items', [])
+        except requests.exceptions.RequestException as e:
+            logger.error(f"批量查找 Emby 项目时出错 (TMDB IDs: {batch}): {e}")
+            return []
+
+    str_ids = [str(tid) for tid in tmdb_ids]
+    batches = [str_ids[i:i + _PROVIDER_ID_BATCH_SIZE] for i in range(0, len(str_ids), _PROVIDER_ID_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+        for items in executor.map(_fetch_batch, batches):
+            for item in items:
+                item_tmdb = str(item.get('ProviderIds', {}).get('Tmdb'))
+                if item_tmdb in id_lookup and item.get('Type') in valid_types:
+                    results[id_lookup[item_tmdb]].append(item)
+    return results
+
+def _extract_item_tags(item_data: dict) -> List[str]:
+    """从 Emby 项目数据中提取标签列表（兼容 Tags 和 TagItems 两种字段）"""
+    if item_data.get("Tags"):
+        return item_data["Tags"]
+    if "TagItems" in item_data:
+        return [t.get('Name') for t in item_data["TagItems"] if t.get('Name')]
+    return []
+
 def update_item_metadata(
     item_id: str,
     tags_to_set: List[str],
-    mode: Literal['merge', 'overwrite'] = 'merge'
+    mode: Literal['merge', 'overwrite'] = 'merge',
+    item_data: Optional[dict] = None
 ) -> bool:
     """
     更新指定 Emby 项目的元数据（当前仅支持标签）。
@@ -101,46 +215,62 @@ def update_item_metadata(
     :param item_id: Emby 媒体项目 ID
     :param tags_to_set: 要设置的标签列表
     :param mode: 'merge' (合并) 或 'overwrite' (覆盖)
+    :param item_data: 可选的调用方已持有的项目数据（含 Tags/TagItems），
+                      用于在标签无变化时直接跳过所有 HTTP 请求
     :return: 更新是否成功
     """
     if not config.EMBY_SERVER_URL:
         print("错误: EMBY_SERVER_URL 未配置")
         return False
 
-    # 1. 获取项目的完整数据，这是更新所必需的
-    item_url = f"{config.EMBY_SERVER_URL}/emby/Items/{item_id}"
-    user_id = _get_user_id()
-    if not user_id:
-        print(f"错误: 无法获取 UserID，无法更新项目 {item_id}")
-        return False
-    
-    # 使用 /Users/{UserId}/Items/{Id} 获取项目信息
-    get_url = f"{config.EMBY_SERVER_URL}/emby/Users/{user_id}/Items/{item_id}"
-    try:
-        item_response = requests.get(get_url, headers=_get_headers())
-        item_response.raise_for_status()
-        item_data = item_response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"获取项目 {item_id} 的详细信息时出错: {e}")
-        return False
+    # 快速路径：若调用方提供的项目数据已能判断标签无变化，
+    # 则无需任何 GET/POST 请求（合并与覆盖两种模式都适用）
+    if item_data is not None:
+        prefetched_tag_set = set(_extract_item_tags(item_data))
+        if mode == 'merge':
+            prefetched_desired = prefetched_tag_set | set(tags_to_set)
+        else: # overwrite
+            prefetched_desired = set(tags_to_set)
+        if prefetched_desired == prefetched_tag_set:
+            print(f"项目 {item_id} 的标签无需更新（快速路径）。")
+            return True
+
+    # 1. 获取项目数据。调用方预取的数据（来自 get_all_emby_items 等）
+    # 只包含列表查询收窄后的字段，足够上面的快速路径使用；但回传完整
+    # item 的模式下，POST 主体必须来自单项 GET 的完整数据，否则会把
+    # 裁剪过的列表级字典写回 Emby，丢失其余元数据
+    if item_data is None or config.EMBY_SEND_FULL_ITEM:
+        user_id = _get_user_id()
+        if not user_id:
+            print(f"错误: 无法获取 UserID，无法更新项目 {item_id}")
+            return False
+
+        # 使用 /Users/{UserId}/Items/{Id} 获取项目信息
+        get_url = f"{config.EMBY_SERVER_URL}/emby/Users/{user_id}/Items/{item_id}"
+        try:
+            item_response = _SESSION.get(get_url)
+            item_response.raise_for_status()
+            item_data = jsonutil.loads(item_response.content)
+        except requests.exceptions.RequestException as e:
+            print(f"获取项目 {item_id} 的详细信息时出错: {e}")
+            return False
 
     # 2. 计算最终的标签列表
-    original_tags = []
-    if "Tags" in item_data and item_data["Tags"]:
-        original_tags = item_data["Tags"]
-    elif "TagItems" in item_data:
-        original_tags = [t.get('Name') for t in item_data["TagItems"] if t.get('Name')]
+    original_tags = _extract_item_tags(item_data)
 
+    original_tag_set = set(original_tags)
     if mode == 'merge':
-        final_tags = sorted(list(set(original_tags + tags_to_set)))
+        desired_tag_set = original_tag_set | set(tags_to_set)
     else: # overwrite
-        final_tags = sorted(list(set(tags_to_set)))
+        desired_tag_set = set(tags_to_set)
 
-    # 如果标签没有变化，则无需更新
-    if final_tags == sorted(original_tags):
+    # 如果标签没有变化，则无需更新（集合比较，免去两次排序）
+    if desired_tag_set == original_tag_set:
         print(f"项目 {item_id} 的标签无需更新。")
         return True
 
+    final_tags = sorted(desired_tag_set)
+
     item_data['Tags'] = final_tags
     # Emby 需要 TagItems 字段来配合更新
     item_data['TagItems'] = [{"Name": tag} for tag in final_tags]
@@ -153,9 +283,23 @@ def update_item_metadata(
         item_data['LockedFields'] = list(locked_fields)
 
     # 4. 发送 POST 请求更新项目
+    # Emby 的更新端点普遍按整体替换处理，默认回传完整的 item JSON；
+    # 确认所用版本接受部分更新后，可配置 send_full_item=false 只发送
+    # 标签相关字段
+    if config.EMBY_SEND_FULL_ITEM:
+        payload = item_data
+    else:
+        payload = {
+            'Id': item_id,
+            'Tags': final_tags,
+            'TagItems': item_data['TagItems'],
+            'LockedFields': item_data.get('LockedFields', []),
+        }
+
     update_url = f"{config.EMBY_SERVER_URL}/emby/Items/{item_id}"
     try:
-        post_response = requests.post(update_url, headers=_get_headers(), json=item_data)
+        # 请求头中已声明 Content-Type: application/json，编码走 jsonutil
+        post_response = _SESSION.post(update_url, data=jsonutil.dumps(payload).encode('utf-8'))
         post_response.raise_for_status()
         print(f"成功更新项目 {item_id} 的标签 ({mode}模式)。最终标签: {final_tags}")
         return True
@@ -166,6 +310,96 @@ def update_item_metadata(
             print(f"响应内容: {post_response.text}")
         return False
 
+# 分页大小：较大的页可以减少总请求数
+_PAGE_LIMIT = 500
+
+def _fetch_items_page(url: str, query: str, start_index: int) -> dict:
+    """
+    获取单页 Emby 项目，返回 API 原始响应字典。
+    :param query: 预编码好的查询串（不含 StartIndex）。分页遍历中
+                  只有 StartIndex 逐页变化，查询串由调用方编码一次，
+                  这里直接拼接，省掉 requests 每页重复的 urlencode
+    """
+    response = _SESSION.get(f"{url}?{query}&StartIndex={start_index}")
+    response.raise_for_status()
+    return jsonutil.loads(response.content)
+
+def _get_paged_items(url: str, params: dict, what: str) -> List[dict]:
+    """
+    获取某个 Items 端点的全部分页结果。
+    先取第一页读出 TotalRecordCount，剩余页通过线程池并发获取，
+    按偏移顺序拼接，将 N 次串行往返压缩为约两轮。
+    """
+    limit = params['Limit']
+    query = urlencode(params)
+    try:
+        logger.info(f"正在获取{what}: StartIndex=0, Limit={limit}")
+        first_page = _fetch_items_page(url, query, 0)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"获取{what}时出错: {e}")
+        return []
+
+    all_items = list(first_page.get('Items', []))
+    total_count = first_page.get('TotalRecordCount', 0)
+    logger.info(f"{what}总记录数: {total_count}，首页获取 {len(all_items)} 个。")
+
+    if not all_items or len(all_items) >= total_count:
+        return all_items
+
+    offsets = range(limit, total_count, limit)
+    if not offsets:
+        # 首页少于 TotalRecordCount 但总数不足一页时（Emby 的计数可能
+        # 包含响应中被过滤掉的项目），没有后续页可取
+        return all_items
+    try:
+        with ThreadPoolExecutor(max_workers=min(8, len(offsets))) as executor:
+            pages = executor.map(lambda offset: _fetch_items_page(url, query, offset), offsets)
+            for page in pages:
+                all_items.extend(page.get('Items', []))
+    except requests.exceptions.RequestException as e:
+        logger.error(f"获取{what}时出错: {e}")
+        return []
+
+    logger.info(f"{what}获取完成，共 {len(all_items)} 个项目。")
+    return all_items
+
+def iter_all_emby_items(item_type: str = "Movie,Series",
+                        fields: str = 'ProviderIds,Tags,TagItems,LockedFields'):
+    """
+    逐页迭代 Emby 中所有指定类型的媒体项目（生成器）。
+    与 get_all_emby_items 相比，任一时刻内存中最多只有一页项目，
+    适合只遍历一次的消费方（如批量清理）。
+    :param fields: 请求的附加字段，只遍历标签时可以收窄以减小响应体积
+    """
+    if not config.EMBY_SERVER_URL:
+        print("错误: EMBY_SERVER_URL 未配置")
+        return
+
+    url = f"{config.EMBY_SERVER_URL}/emby/Items"
+    params = {
+        'Recursive': 'true',
+        'IncludeItemTypes': item_type,
+        'Fields': fields,
+        'Limit': _PAGE_LIMIT,
+        'api_key': config.EMBY_API_KEY
+    }
+    query = urlencode(params)
+
+    start_index = 0
+    while True:
+        try:
+            data = _fetch_items_page(url, query, start_index)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"迭代 Emby 项目时出错: {e}")
+            return
+        items = data.get('Items', [])
+        yield from items
+
+        total_count = data.get('TotalRecordCount', 0)
+        start_index += len(items)
+        if not items or start_index >= total_count:
+            return
+
 # 为了向后兼容旧的测试路由，保留此函数，但让它调用新的核心函数
 def get_all_emby_items(item_type: str = "Movie,Series") -> List[dict]:
     """
@@ -182,42 +416,17 @@ def get_all_emby_items(item_type: str = "Movie,Series") -> List[dict]:
         'Recursive': 'true',
         'IncludeItemTypes': item_type,
         'Fields': 'ProviderIds,Tags,TagItems,LockedFields',
-        'Limit': 100, # 将 Limit 设置为较小的值，以便更好地观察分页
+        'Limit': _PAGE_LIMIT,
         'api_key': config.EMBY_API_KEY # 在参数中包含 api_key
     }
-    
-    all_items = []
-    start_index = 0
-    import logging
-    logger = logging.getLogger(__name__) # 获取 logger 实例
-
-    while True:
-        current_params = params.copy()
-        current_params['StartIndex'] = start_index
-        try:
-            logger.info(f"正在获取 Emby 项目: StartIndex={start_index}, Limit={params['Limit']}") # 新增日志
-            # 同时使用请求头和查询参数，以确保兼容性
-            response = requests.get(url, headers=_get_headers(), params=current_params)
-            response.raise_for_status()
-            data = response.json()
-            items = data.get('Items', [])
-            all_items.extend(items)
-            
-            total_count = data.get('TotalRecordCount', 0)
-            logger.info(f"当前获取到 {len(items)} 个项目，总记录数: {total_count}，已获取总数: {len(all_items)}") # 新增日志
-
-            if not items or len(all_items) >= total_count: # 如果当前页没有项目，或者已获取的项目数达到或超过总数，说明已经获取完所有项目
-                break
-            start_index += params['Limit']
-        except requests.exceptions.RequestException as e:
-            logger.error(f"获取所有 Emby 项目时出错: {e}") # 使用 logger.error
-            return []
-    return all_items
+    return _get_paged_items(url, params, "Emby 项目")
 
-def get_favorite_emby_items(item_type: str = "Movie,Series") -> List[dict]:
+def get_favorite_emby_items(item_type: str = "Movie,Series",
+                            fields: str = 'ProviderIds,Tags,TagItems,LockedFields') -> List[dict]:
     """
     获取 Emby 中所有指定类型的收藏媒体项目。
     :param item_type: Emby 的媒体类型, 例如 "Movie", "Series", 或 "Movie,Series"
+    :param fields: 请求的附加字段
     """
     if not config.EMBY_SERVER_URL:
         logger.error("错误: EMBY_SERVER_URL 未配置")
@@ -232,58 +441,38 @@ def get_favorite_emby_items(item_type: str = "Movie,Series") -> List[dict]:
     params = {
         'Recursive': 'true',
         'IncludeItemTypes': item_type,
-        'Fields': 'ProviderIds,Tags,TagItems,LockedFields',
+        'Fields': fields,
         'IsFavorite': 'true', # 关键参数：只获取收藏项目
-        'Limit': 100,
+        'Limit': _PAGE_LIMIT,
         'api_key': config.EMBY_API_KEY
     }
-    
-    all_items = []
-    start_index = 0
-
-    while True:
-        current_params = params.copy()
-        current_params['StartIndex'] = start_index
-        try:
-            logger.info(f"正在获取 Emby 收藏项目: StartIndex={start_index}, Limit={params['Limit']}")
-            response = requests.get(url, headers=_get_headers(), params=current_params)
-            response.raise_for_status()
-            data = response.json()
-            items = data.get('Items', [])
-            all_items.extend(items)
-            
-            total_count = data.get('TotalRecordCount', 0)
-            logger.info(f"当前获取到 {len(items)} 个收藏项目，总记录数: {total_count}，已获取总数: {len(all_items)}")
-
-            if not items or len(all_items) >= total_count:
-                break
-            start_index += params['Limit']
-        except requests.exceptions.RequestException as e:
-            logger.error(f"获取所有 Emby 收藏项目时出错: {e}")
-            return []
-    return all_items
+    return _get_paged_items(url, params, "Emby 收藏项目")
 
 def clear_all_item_tags() -> dict:
     """
     清除 Emby 媒体库中所有电影和剧集的标签。
     """
     print("开始清除所有 Emby 媒体项目的标签...")
-    all_items = get_all_emby_items()
-    
+
     cleared_count = 0
     failed_count = 0
-    
-    for item in all_items:
-        item_id = item.get('Id')
-        item_name = item.get('Name')
-        if item_id:
-            print(f"正在清除项目 '{item_name}' (ID: {item_id}) 的标签...")
-            if update_item_metadata(item_id, [], mode='overwrite'):
+
+    # 逐页迭代提交任务，更新本身是纯 I/O，交给线程池并发执行
+    with ThreadPoolExecutor(max_workers=_TAGGING_CONCURRENCY) as executor:
+        futures = []
+        for item in iter_all_emby_items(fields='Tags,TagItems,LockedFields'):
+            item_id = item.get('Id')
+            item_name = item.get('Name')
+            if item_id:
+                print(f"正在清除项目 '{item_name}' (ID: {item_id}) 的标签...")
+                futures.append(executor.submit(update_item_metadata, item_id, [], 'overwrite', item))
+            else:
+                print(f"警告: 发现一个没有 ID 的项目: {item}")
+        for future in as_completed(futures):
+            if future.result():
                 cleared_count += 1
             else:
                 failed_count += 1
-        else:
-            print(f"警告: 发现一个没有 ID 的项目: {item}")
 
     print(f"清除完成。成功清除 {cleared_count} 个项目的标签，{failed_count} 个项目清除失败。")
     return {
@@ -297,40 +486,41 @@ def clear_specific_item_tags(tags_to_remove: List[str]) -> dict:
     从 Emby 媒体库中所有电影和剧集中移除指定的标签。
     """
     print(f"开始从所有 Emby 媒体项目中移除指定标签: {tags_to_remove}...")
-    all_items = get_all_emby_items()
-    
+
     processed_count = 0
     removed_from_count = 0
     failed_count = 0
-    
-    for item in all_items:
-        item_id = item.get('Id')
-        item_name = item.get('Name')
-        if not item_id:
-            print(f"警告: 发现一个没有 ID 的项目: {item}")
-            continue
-
-        processed_count += 1
-        print(f"正在处理项目 '{item_name}' (ID: {item_id})...")
-
-        original_tags = []
-        if "Tags" in item and item["Tags"]:
-            original_tags = item["Tags"]
-        elif "TagItems" in item:
-            original_tags = [t.get('Name') for t in item["TagItems"] if t.get('Name')]
-        
-        # 计算新的标签列表：移除所有 tags_to_remove 中的标签
-        new_tags = [tag for tag in original_tags if tag not in tags_to_remove]
 
-        # 如果标签列表有变化，才进行更新
-        if sorted(new_tags) != sorted(original_tags):
-            print(f"项目 '{item_name}' (ID: {item_id}) 的标签将从 {original_tags} 更新为 {new_tags}")
-            if update_item_metadata(item_id, new_tags, mode='overwrite'):
+    # 标签差异在本地计算（纯 CPU），只有真正需要更新的项目才提交到
+    # 线程池并发执行
+    with ThreadPoolExecutor(max_workers=_TAGGING_CONCURRENCY) as executor:
+        futures = []
+        for item in iter_all_emby_items(fields='Tags,TagItems,LockedFields'):
+            item_id = item.get('Id')
+            item_name = item.get('Name')
+            if not item_id:
+                print(f"警告: 发现一个没有 ID 的项目: {item}")
+                continue
+
+            processed_count += 1
+            print(f"正在处理项目 '{item_name}' (ID: {item_id})...")
+
+            original_tags = _extract_item_tags(item)
+
+            # 计算新的标签列表：移除所有 tags_to_remove 中的标签
+            new_tags = [tag for tag in original_tags if tag not in tags_to_remove]
+
+            # 如果标签列表有变化，才进行更新
+            if sorted(new_tags) != sorted(original_tags):
+                print(f"项目 '{item_name}' (ID: {item_id}) 的标签将从 {original_tags} 更新为 {new_tags}")
+                futures.append(executor.submit(update_item_metadata, item_id, new_tags, 'overwrite', item))
+            else:
+                print(f"项目 '{item_name}' (ID: {item_id}) 不包含任何要移除的标签，跳过更新。")
+        for future in as_completed(futures):
+            if future.result():
                 removed_from_count += 1
             else:
                 failed_count += 1
-        else:
-            print(f"项目 '{item_name}' (ID: {item_id}) 不包含任何要移除的标签，跳过更新。")
 
     print(f"指定标签移除完成。总处理 {processed_count} 个项目，成功从 {removed_from_count} 个项目中移除标签，{failed_count} 个项目处理失败。")
     return {
@@ -362,7 +552,7 @@ async def tag_all_media_items(
         items_to_process = get_all_emby_items()
         logger.info(f"从 Emby API 获取到 {len(items_to_process)} 个全库媒体项目。")
     elif library_type == 'favorite':
-        favorite_items = get_favorite_emby_items()
+        favorite_items = get_favorite_emby_items(fields='ProviderIds')
         logger.info(f"从 Emby API 获取到 {len(favorite_items)} 个收藏媒体项目。")
         
         # 收集所有收藏项目的 TMDB ID 和类型
@@ -373,29 +563,38 @@ async def tag_all_media_items(
             if tmdb_id and item_type:
                 unique_favorite_media_keys.add((tmdb_id, item_type))
         
-        # 根据这些 TMDB ID 和类型，从整个库中查找所有相关项目
-        processed_item_ids = set() # 存储已添加到 items_to_process 的项目 ID，用于去重
+        # 根据这些 TMDB ID 和类型，从整个库中查找所有相关项目。
+        # 一次批量查询拿到所有 TMDB ID 的全部版本，再按收藏项目的类型
+        # 在本地过滤，避免对每个收藏条目单独发起一次查询
+        wanted_types_by_id: Dict[str, Set[str]] = {}
         for tmdb_id, item_type in unique_favorite_media_keys:
-            # 始终查询整个库中所有 Movie 和 Series 类型的项目，以确保找到所有版本
-            # 然后在 find_emby_items_by_tmdb_id 内部根据传入的 item_type 进行过滤
-            found_items = find_emby_items_by_tmdb_id(tmdb_id, item_type)
+            wanted_types_by_id.setdefault(str(tmdb_id), set()).add(item_type)
+        found_by_id = find_emby_items_by_tmdb_ids(list(wanted_types_by_id.keys()))
+
+        processed_item_ids = set() # 存储已添加到 items_to_process 的项目 ID，用于去重
+        for tmdb_id, found_items in found_by_id.items():
+            wanted_types = wanted_types_by_id.get(tmdb_id, set())
             for item in found_items:
-                if item.get('Id') not in processed_item_ids:
+                if item.get('Type') in wanted_types and item.get('Id') not in processed_item_ids:
                     items_to_process.append(item)
                     processed_item_ids.add(item.get('Id'))
         logger.info(f"根据收藏项目扩展后，最终需要处理 {len(items_to_process)} 个媒体项目 (包含多版本)。")
 
-    processed_count = 0
-    updated_count = 0
-    failed_count = 0
+    # 并发处理所有项目：每个项目的 TMDB 查询和 Emby 更新都是 I/O 操作，
+    # 用信号量限制并发数，避免压垮 Emby 服务器
+    semaphore = asyncio.Semaphore(_TAGGING_CONCURRENCY)
+    # 同一 (tmdb_id, 类型) 在本次运行中只请求一次 TMDB（多版本项目共享结果）
+    tmdb_details_cache: dict = {}
 
-    # 直接遍历 items_to_process
-    for item in items_to_process:
-        processed_count += 1
-        if await _process_single_item_for_tagging(item, mode, logger, tmdb_service, rule_service, custom_tags):
-            updated_count += 1
-        else:
-            failed_count += 1
+    async def _process_with_limit(item: dict) -> bool:
+        async with semaphore:
+            return await _process_single_item_for_tagging(item, mode, logger, tmdb_service, rule_service, custom_tags, tmdb_details_cache)
+
+    results = await asyncio.gather(*(_process_with_limit(item) for item in items_to_process))
+
+    processed_count = len(results)
+    updated_count = sum(1 for success in results if success)
+    failed_count = processed_count - updated_count
 
     logger.info(f"所有媒体项目打标签完成。总处理 {processed_count} 个，成功更新 {updated_count} 个，失败 {failed_count} 个。")
     return {
@@ -414,11 +613,14 @@ async def _process_single_item_for_tagging(
     logger,
     tmdb_service,
     rule_service,
-    custom_tags: Optional[List[str]] = None # 添加 custom_tags 参数
+    custom_tags: Optional[List[str]] = None, # 添加 custom_tags 参数
+    tmdb_details_cache: Optional[dict] = None
 ) -> bool:
     """
     处理单个 Emby 项目的标签生成和更新逻辑。
     返回 True 表示成功更新，False 表示失败或跳过。
+    :param tmdb_details_cache: 可选的 (tmdb_id, media_type) -> details 缓存，
+                               用于多版本项目复用同一份 TMDB 响应
     """
     item_id = item.get('Id')
     item_name = item.get('Name')
@@ -445,7 +647,13 @@ async def _process_single_item_for_tagging(
                 logger.warning(f"不支持的媒体类型: {item_type}，跳过处理。")
                 return False
 
-            details = tmdb_service.get_tmdb_details(tmdb_id, media_type_tmdb)
+            cache_key = (tmdb_id, media_type_tmdb)
+            if tmdb_details_cache is not None and cache_key in tmdb_details_cache:
+                details = tmdb_details_cache[cache_key]
+            else:
+                details = await asyncio.to_thread(tmdb_service.get_tmdb_details_cached, tmdb_id, media_type_tmdb)
+                if tmdb_details_cache is not None:
+                    tmdb_details_cache[cache_key] = details
             if not details:
                 logger.warning(f"无法从 TMDB 获取项目 '{item_name}' (TMDB ID: {tmdb_id}) 的信息，跳过。")
                 return False
@@ -464,12 +672,7 @@ async def _process_single_item_for_tagging(
             if not countries:
                 original_language = details.get('original_language')
                 if original_language:
-                    lang_to_country_map = {
-                        "en": "US", "zh": "CN", "ja": "JP", "ko": "KR", "fr": "FR", "de": "DE",
-                        "es": "ES", "it": "IT", "hi": "IN", "ar": "SA", "pt": "BR", "ru": "RU",
-                        "th": "TH", "sv": "SE", "da": "DK", "no": "NO", "nl": "NL", "pl": "PL",
-                    }
-                    mapped_country = lang_to_country_map.get(original_language)
+                    mapped_country = LANG_TO_COUNTRY_MAP.get(original_language)
                     if mapped_country:
                         countries = [mapped_country]
             
@@ -496,7 +699,18 @@ async def _process_single_item_for_tagging(
             logger.info(f"项目 '{item_name}' 没有标签需要应用，跳过更新。")
             return False
 
-        if update_item_metadata(item_id=item_id, tags_to_set=final_tags_to_apply, mode=mode):
+        # 本地差异检查：重复运行时大多数项目的标签已是目标状态，
+        # 此时直接跳过，不发起任何 HTTP 请求
+        current_tags = set(_extract_item_tags(item))
+        if mode == 'merge':
+            desired_tags = current_tags | set(final_tags_to_apply)
+        else: # overwrite
+            desired_tags = set(final_tags_to_apply)
+        if desired_tags == current_tags:
+            logger.info(f"项目 '{item_name}' 的标签已是目标状态，跳过更新。")
+            return True
+
+        if await asyncio.to_thread(update_item_metadata, item_id, final_tags_to_apply, mode, item):
             return True
         else:
             return False
@@ -1,7 +1,11 @@
-import json
+import functools
 import os
 import re
+import sys
+import threading
+from dataclasses import dataclass
 from typing import List, Dict, Any, Optional, Set
+from core import jsonutil
 
 # --- 规则文件路径 ---
 RULES_FILE_PATH = "/app/config/rules.json"
@@ -38,14 +42,61 @@ def _parse_years_from_string(year_str: str) -> List[int]:
                 print(f"警告：无效的年份格式 '{part}'")
     return sorted(list(years_list))
 
+def _parse_year_spec(year_str: str):
+    """
+    把年份字符串解析为 (单个年份 frozenset, (起, 止) 范围元组) 的紧凑表示。
+    与 _parse_years_from_string 支持的格式一致，但不展开范围——
+    "1900-2025" 只存一个元组而不是 126 个整数，匹配时做区间比较。
+    """
+    singles: Set[int] = set()
+    ranges = []
+    for part in year_str.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            try:
+                start_year_str, end_year_str = part.split('-')
+                start_year = int(start_year_str.strip())
+                end_year = int(end_year_str.strip())
+                if start_year <= end_year:
+                    ranges.append((start_year, end_year))
+            except ValueError:
+                print(f"警告：无效的年份范围格式 '{part}'")
+        else:
+            try:
+                singles.add(int(part))
+            except ValueError:
+                print(f"警告：无效的年份格式 '{part}'")
+    return frozenset(singles), tuple(ranges)
+
+# --- 规则缓存 ---
+# generate_tags 对每个媒体项目都会加载规则，批量打标签时如果每次都
+# 重新读盘并解析 JSON，开销完全浪费。这里按文件 mtime 缓存解析结果，
+# 文件被修改后自动失效。
+_RULES_CACHE: Optional[List[Dict[str, Any]]] = None
+_RULES_MTIME: Optional[int] = None
+# Web 请求和后台打标签任务可能从不同线程同时触发加载，
+# 加锁避免并发重复解析和缓存写入竞争
+_RULES_LOCK = threading.Lock()
+
 def load_rules_from_file() -> List[Dict[str, Any]]:
-    """从文件加载规则"""
+    """从文件加载规则（带 mtime 缓存）"""
+    global _RULES_CACHE, _RULES_MTIME
+
     if not os.path.exists(RULES_FILE_PATH):
         print(f"警告：规则文件未找到: {RULES_FILE_PATH}")
         return []
     try:
-        with open(RULES_FILE_PATH, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        # st_mtime_ns 为整数纳秒，比浮点 st_mtime 分辨率更高，
+        # 同一秒内的快速连续保存也能触发缓存失效
+        mtime = os.stat(RULES_FILE_PATH).st_mtime_ns
+        with _RULES_LOCK:
+            if _RULES_CACHE is not None and mtime == _RULES_MTIME:
+                return _RULES_CACHE
+
+            with open(RULES_FILE_PATH, 'rb') as f:
+                data = jsonutil.loads(f.read())
             rules = data.get("rules", [])
             # 在加载时处理年份范围字符串，填充到 years 列表中
             for rule in rules:
@@ -53,13 +104,198 @@ def load_rules_from_file() -> List[Dict[str, Any]]:
                 year_range_display = conditions.get("year_range_display")
                 if year_range_display and not conditions.get("years"):
                     conditions["years"] = _parse_years_from_string(year_range_display)
+            _RULES_CACHE = rules
+            _RULES_MTIME = mtime
             return rules
-    except (json.JSONDecodeError, IOError) as e:
+    except (ValueError, IOError, OSError) as e: # orjson/json 的解析错误都是 ValueError 子类
         print(f"加载或解析 rules.json 时出错: {e}")
         return []
 
+# --- 规则预编译 ---
+# 条件集合（国家/类型/年份）在匹配时只做成员测试和相等比较，
+# 预先转换成 frozenset 可以避免对每个媒体项目重复构建 set。
+# 预编译规则、倒排索引和位编码表互相对应，必须作为整体读写：
+# 全部装进一个不可变的 _RuleSnapshot，重编译时在锁内整体替换，
+# 匹配路径只在入口读一次引用，不会读到新旧混合的状态
+_SNAPSHOT: Optional["_RuleSnapshot"] = None
+_COMPILE_LOCK = threading.Lock()
+
+@dataclass(slots=True, frozen=True)
+class PreparedRule:
+    """
+    单条规则的预编译表示。slots 省掉每条规则一个实例字典，
+    匹配循环里的字段读取从哈希查找变成 C 层属性加载。
+    """
+    tag: str
+    item_type: str
+    match_all: bool
+    is_negative: bool
+    countries: frozenset
+    genre_ids: frozenset
+    year_singles: frozenset
+    year_ranges: tuple
+    # 条件是否存在的布尔值在匹配时反复使用，预先算好
+    has_countries: bool
+    has_genres: bool
+    has_years: bool
+    # 批量路径用的位集编码
+    country_bits: int
+    genre_bits: int
+
+@dataclass(slots=True, frozen=True, eq=False)
+class _RuleSnapshot:
+    """
+    一次编译产出的全部只读状态。eq=False 保留按对象标识的哈希，
+    快照本身作为 _generate_tags_cached 的缓存键的一部分：
+    旧快照算出的结果不可能以新快照为键被写入或命中。
+    """
+    # 预编译的原始规则列表，用于检测缓存是否需要重建
+    source: List[Dict[str, Any]]
+    rules: tuple
+    # 是否存在负向匹配规则（负向规则对无元数据的媒体也可能命中）
+    has_negative: bool
+    # 批量路径用的位编码表：国家/类型值 -> 二进制位
+    country_bit_map: Dict[str, int]
+    genre_bit_map: Dict[int, int]
+    # 倒排索引：条件值 -> 规则下标集合。正向规则只有在至少一个条件值
+    # 与媒体相符时才可能命中，因此逐项评估时可以只看候选规则
+    idx_country: Dict[str, frozenset]
+    idx_genre: Dict[int, frozenset]
+    idx_year: Dict[int, frozenset]
+    # 年份范围规则的 (起, 止, 规则下标) 列表，候选收集时按区间判断
+    idx_year_ranges: tuple
+    # 负向规则在条件不匹配时也可能命中，必须始终评估
+    always_rule_indexes: frozenset
+
+def _compile_rules(rules: List[Dict[str, Any]]):
+    """
+    将原始规则转换为 PreparedRule 形式的预编译表示，
+    返回 (预编译规则列表, 国家位编码表, 类型位编码表)
+    """
+    parsed = []
+    # 为批量路径分配位编码：规则引用过的每个国家/类型各占一个二进制位，
+    # 规则的条件集合折叠成一个 int，交集/相等测试变成整数位运算
+    country_bit_map: Dict[str, int] = {}
+    genre_bit_map: Dict[int, int] = {}
+    for rule in rules:
+        conditions = rule.get("conditions", {})
+        # 国家代码 intern 后比较可以先走指针相等的快路径
+        countries = frozenset(sys.intern(c) for c in (conditions.get("countries") or []))
+        genre_ids = frozenset(conditions.get("genre_ids") or [])
+        # 年份优先级与基线一致：非空的 years 列表优先，只有 years 为空
+        # 时才用 year_range_display（手工编辑的文件两个字段可能不一致）。
+        # years 恰好是范围串的加载时填充结果时，仍编译成紧凑的区间表示，
+        # 避免把跨几十年的范围存成大整数集合
+        years_list = conditions.get("years") or []
+        year_range_display = conditions.get("year_range_display")
+        if years_list:
+            if year_range_display and years_list == _parse_years_from_string(year_range_display):
+                year_singles, year_ranges = _parse_year_spec(year_range_display)
+            else:
+                year_singles, year_ranges = frozenset(years_list), ()
+        elif year_range_display:
+            year_singles, year_ranges = _parse_year_spec(year_range_display)
+        else:
+            year_singles, year_ranges = frozenset(), ()
+        # 没有任何条件且媒体类型为 all 的规则在匹配时历来被显式跳过，
+        # 永远不会产出标签；改在编译时剔除，省掉内层循环里的死分支
+        if not countries and not genre_ids and not year_singles and not year_ranges \
+                and rule.get("item_type", "all") == "all":
+            print(f"警告：规则 '{rule.get('tag', '?')}' 没有任何条件且媒体类型为 all，永远不会命中，已忽略。")
+            continue
+        for country in countries:
+            if country not in country_bit_map:
+                country_bit_map[country] = 1 << len(country_bit_map)
+        for genre_id in genre_ids:
+            if genre_id not in genre_bit_map:
+                genre_bit_map[genre_id] = 1 << len(genre_bit_map)
+        parsed.append((rule, countries, genre_ids, year_singles, year_ranges))
+
+    compiled = []
+    for rule, countries, genre_ids, year_singles, year_ranges in parsed:
+        country_bits = 0
+        for country in countries:
+            country_bits |= country_bit_map[country]
+        genre_bits = 0
+        for genre_id in genre_ids:
+            genre_bits |= genre_bit_map[genre_id]
+        compiled.append(PreparedRule(
+            tag=rule["tag"],
+            item_type=rule.get("item_type", "all"),
+            match_all=rule.get("match_all_conditions", False),
+            is_negative=rule.get("is_negative_match", False),
+            countries=countries,
+            genre_ids=genre_ids,
+            year_singles=year_singles,
+            year_ranges=year_ranges,
+            has_countries=bool(countries),
+            has_genres=bool(genre_ids),
+            has_years=bool(year_singles or year_ranges),
+            country_bits=country_bits,
+            genre_bits=genre_bits,
+        ))
+    return compiled, country_bit_map, genre_bit_map
+
+def _build_rule_indexes(compiled: List["PreparedRule"]):
+    """根据预编译规则构建倒排索引和必评估规则集合"""
+    idx_country: Dict[str, Set[int]] = {}
+    idx_genre: Dict[int, Set[int]] = {}
+    idx_year: Dict[int, Set[int]] = {}
+    idx_year_ranges: List[tuple] = []
+    always: Set[int] = set()
+    for i, rule in enumerate(compiled):
+        if rule.is_negative:
+            always.add(i)
+            continue
+        for country in rule.countries:
+            idx_country.setdefault(country, set()).add(i)
+        for genre_id in rule.genre_ids:
+            idx_genre.setdefault(genre_id, set()).add(i)
+        for year in rule.year_singles:
+            idx_year.setdefault(year, set()).add(i)
+        # 年份范围不展开进索引，单独按区间收集候选
+        for start_year, end_year in rule.year_ranges:
+            idx_year_ranges.append((start_year, end_year, i))
+    # 索引在编译后只读，冻结以防匹配路径意外修改
+    idx_country = {k: frozenset(v) for k, v in idx_country.items()}
+    idx_genre = {k: frozenset(v) for k, v in idx_genre.items()}
+    idx_year = {k: frozenset(v) for k, v in idx_year.items()}
+    return idx_country, idx_genre, idx_year, tuple(idx_year_ranges), frozenset(always)
+
+def _get_rule_snapshot() -> "_RuleSnapshot":
+    """获取当前规则快照，原始规则缓存刷新时自动重新编译"""
+    global _SNAPSHOT
+    rules = load_rules_from_file()
+    # 无锁快路径：快照是整体替换的，读到的引用自身总是一致的
+    snapshot = _SNAPSHOT
+    if snapshot is not None and snapshot.source is rules:
+        return snapshot
+    with _COMPILE_LOCK:
+        snapshot = _SNAPSHOT
+        if snapshot is not None and snapshot.source is rules:
+            return snapshot
+        compiled, country_bit_map, genre_bit_map = _compile_rules(rules)
+        idx_country, idx_genre, idx_year, idx_year_ranges, always = _build_rule_indexes(compiled)
+        snapshot = _RuleSnapshot(
+            source=rules,
+            rules=tuple(compiled),
+            has_negative=any(rule.is_negative for rule in compiled),
+            country_bit_map=country_bit_map,
+            genre_bit_map=genre_bit_map,
+            idx_country=idx_country,
+            idx_genre=idx_genre,
+            idx_year=idx_year,
+            idx_year_ranges=idx_year_ranges,
+            always_rule_indexes=always,
+        )
+        _SNAPSHOT = snapshot
+        # 正确性由缓存键里的快照保证；清空只是尽快释放旧快照的条目
+        _generate_tags_cached.cache_clear()
+        return snapshot
+
 def save_rules_to_file(rules: List[Dict[str, Any]]) -> bool:
     """将规则列表保存到文件"""
+    global _RULES_MTIME
     try:
         # 在保存前，如果 year_range_display 存在，清空 years 列表，避免重复存储
         # 这样可以确保 year_range_display 是主要来源，years 是解析结果
@@ -71,98 +307,211 @@ def save_rules_to_file(rules: List[Dict[str, Any]]) -> bool:
                 conditions["years"] = [] # 清空 years 列表，只保留 year_range_display
             rules_to_save.append(rule_copy)
 
-        with open(RULES_FILE_PATH, 'w', encoding='utf-8') as f:
-            json.dump({"rules": rules_to_save}, f, ensure_ascii=False, indent=2)
+        # 原子写入：先写临时文件并 fsync，再整体替换，
+        # 中途崩溃不会留下截断的 rules.json（与 config_service 的做法一致）
+        data = jsonutil.dumps({"rules": rules_to_save}, indent=True).encode('utf-8')
+        tmp_path = RULES_FILE_PATH + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, RULES_FILE_PATH)
+        # 写入成功后使缓存失效，下次加载时重新读取
+        _RULES_MTIME = None
+        _generate_tags_cached.cache_clear()
         return True
-    except IOError as e:
+    except (IOError, OSError) as e:
         print(f"写入 rules.json 时出错: {e}")
         return False
 
+def _rule_matches(rule: "PreparedRule", media_countries: frozenset, media_genres: frozenset,
+                  media_year: Optional[int], item_type: str) -> bool:
+    """判断单条预编译规则是否命中给定媒体的条件集合"""
+    # 媒体类型门槛不参与负向反转，类型不符时无论条件结果如何
+    # 最终都是不匹配，先行排除，省掉全部条件集合运算
+    if not _type_matches(rule.item_type, item_type):
+        return False
+
+    rule_countries = rule.countries
+    rule_genre_ids = rule.genre_ids
+    match_all_conditions = rule.match_all
+    has_countries = rule.has_countries
+    has_genres = rule.has_genres
+    has_years = rule.has_years
+
+    # --- 惰性计算各条件的正向匹配结果 ---
+    # 条件之间恒为“与”关系，前一个条件落空后，后面的条件无需再算，
+    # 也省掉收集布尔列表再 all(...) 的分配开销
+    # 没有定义任何条件时默认不匹配
+    pre_overall_match = has_countries or has_genres or has_years
+    if pre_overall_match and has_countries:
+        if match_all_conditions:
+            # 正向严格匹配：媒体国家集合完全等于规则国家集合
+            pre_overall_match = (media_countries == rule_countries)
+        else:
+            # 正向模糊匹配：媒体国家集合与规则国家集合有交集
+            # isdisjoint 是单次 C 层调用，比 any(... in ...) 生成器快
+            pre_overall_match = not rule_countries.isdisjoint(media_countries)
+    if pre_overall_match and has_genres:
+        if match_all_conditions:
+            # 正向严格匹配：媒体类型集合完全等于规则类型集合
+            pre_overall_match = (media_genres == rule_genre_ids)
+        else:
+            # 正向模糊匹配：媒体类型集合与规则类型集合有交集
+            pre_overall_match = not rule_genre_ids.isdisjoint(media_genres)
+    if pre_overall_match and has_years: # 规则有年份要求
+        if media_year is not None: # 媒体有年份信息
+            pre_overall_match = (media_year in rule.year_singles) or \
+                any(start <= media_year <= end for start, end in rule.year_ranges)
+        else: # 规则有年份要求但媒体没有年份信息，则不匹配
+            pre_overall_match = False
+
+    # --- 根据 is_negative_match 反转初步匹配结果 ---
+    if rule.is_negative:
+        return not pre_overall_match
+    return pre_overall_match
+
+def _type_matches(rule_item_type: str, item_type: str) -> bool:
+    """
+    规则媒体类型门槛。
+    特殊处理：如果 rule_item_type 是 "series"，则 item_type 为 "series" 或 "tv" 都算匹配
+    """
+    if rule_item_type == "series":
+        return item_type == "series" or item_type == "tv"
+    return rule_item_type == "all" or rule_item_type == item_type
+
+@functools.lru_cache(maxsize=4096)
+def _generate_tags_cached(snapshot: "_RuleSnapshot", media_countries: frozenset,
+                          media_genres: frozenset, media_year: Optional[int],
+                          item_type: str) -> tuple:
+    """
+    generate_tags 的核心匹配逻辑，按 (规则快照, 媒体特征) 做 lru_cache
+    记忆化。全库扫描中大量媒体共享相同的 (国家, 类型, 年份, 媒体类型)
+    组合，命中时规则循环退化为一次字典查找。快照按对象标识参与缓存键，
+    规则重新编译后旧条目天然不会再命中。
+    """
+    rules = snapshot.rules
+    generated_tags = set()
+
+    # 通过倒排索引收集候选规则，避免对每个媒体项目线性扫描全部规则
+    candidate_indexes = set(snapshot.always_rule_indexes)
+    for country in media_countries:
+        candidate_indexes.update(snapshot.idx_country.get(country, ()))
+    for genre_id in media_genres:
+        candidate_indexes.update(snapshot.idx_genre.get(genre_id, ()))
+    if media_year is not None:
+        candidate_indexes.update(snapshot.idx_year.get(media_year, ()))
+        for start_year, end_year, rule_index in snapshot.idx_year_ranges:
+            if start_year <= media_year <= end_year:
+                candidate_indexes.add(rule_index)
+
+    for rule_index in sorted(candidate_indexes):
+        rule = rules[rule_index]
+        # 标签已产出时无需再评估产出同名标签的其他规则
+        if rule.tag in generated_tags:
+            continue
+        if _rule_matches(rule, media_countries, media_genres, media_year, item_type):
+            generated_tags.add(rule.tag)
+    return tuple(generated_tags)
+
 def generate_tags(countries: List[str], genre_ids: List[int], media_year: Optional[int], item_type: str) -> List[str]:
     """
     根据国家、类型 ID、年份和媒体类型生成标签。
     item_type: "movie", "series", "all"
     media_year: 媒体的发布年份或首播年份
     """
-    rules = load_rules_from_file()
-    generated_tags = set()
+    snapshot = _get_rule_snapshot()
 
-    if not rules:
+    if not snapshot.rules:
         return []
 
-    for rule in rules:
-        conditions = rule.get("conditions", {})
-        rule_countries = conditions.get("countries", [])
-        rule_genre_ids = conditions.get("genre_ids", [])
-        rule_item_type = rule.get("item_type", "all") # 默认为 "all"
-        match_all_conditions = rule.get("match_all_conditions", False)
-        is_negative_match = rule.get("is_negative_match", False)
+    # 快速路径：媒体完全没有可匹配的元数据时，正向规则必然全部落空。
+    # 只有负向规则可能对空元数据命中，因此仅在没有负向规则时短路
+    if not countries and not genre_ids and media_year is None and not snapshot.has_negative:
+        return []
 
-        rule_years = conditions.get("years", []) # 此时 rule_years 已经包含了从 year_range_display 解析的年份
+    # 媒体自身的条件集合只构建一次，供所有规则复用；
+    # 媒体国家同样 intern，与规则侧共享字符串对象
+    media_countries = frozenset(sys.intern(c) for c in countries)
+    return list(_generate_tags_cached(snapshot, media_countries, frozenset(genre_ids), media_year, item_type))
 
-        # 如果规则中既没有国家、类型也没有年份，则跳过
-        if not rule_countries and not rule_genre_ids and not rule_years and rule_item_type == "all":
-            continue
+def generate_tags_batch(media_items: List[tuple]) -> List[List[str]]:
+    """
+    对一批媒体批量生成标签，入参为 (countries, genre_ids, media_year, item_type)
+    元组列表，返回与入参顺序对应的标签列表。
+    与逐项调用 generate_tags 等价，但把循环倒置为“规则在外、媒体在内”：
+    规则字段只解引用一次，媒体条件集合只构建一次，适合全库打标签这类
+    一次评估上千个项目的场景。
+    """
+    snapshot = _get_rule_snapshot()
+    rules = snapshot.rules
+    results: List[Set[str]] = [set() for _ in media_items]
+    if not rules or not media_items:
+        return [[] for _ in media_items]
 
-        # --- 计算每个条件的正向匹配结果 ---
-        country_match = True
-        if rule_countries:
-            if match_all_conditions:
-                # 正向严格匹配：媒体国家集合完全等于规则国家集合
-                country_match = (set(countries) == set(rule_countries))
+    # 预先把每个媒体的国家/类型折叠成 int 位集。extra 标记媒体带有
+    # 任何规则都未引用的值——位集里表示不了，但会破坏严格匹配的相等性
+    country_bit_map = snapshot.country_bit_map
+    genre_bit_map = snapshot.genre_bit_map
+    prepared = []
+    for countries, genre_ids, media_year, item_type in media_items:
+        country_bits = 0
+        country_extra = False
+        for country in set(countries):
+            bit = country_bit_map.get(country)
+            if bit is None:
+                country_extra = True
             else:
-                # 正向模糊匹配：媒体国家集合与规则国家集合有交集
-                country_match = any(c in rule_countries for c in countries)
-
-        genre_match = True
-        if rule_genre_ids:
-            if match_all_conditions:
-                # 正向严格匹配：媒体类型集合完全等于规则类型集合
-                genre_match = (set(genre_ids) == set(rule_genre_ids))
+                country_bits |= bit
+        genre_bits = 0
+        genre_extra = False
+        for genre_id in set(genre_ids):
+            bit = genre_bit_map.get(genre_id)
+            if bit is None:
+                genre_extra = True
             else:
-                # 正向模糊匹配：媒体类型集合与规则类型集合有交集
-                genre_match = any(gid in rule_genre_ids for gid in genre_ids)
+                genre_bits |= bit
+        prepared.append((country_bits, country_extra, genre_bits, genre_extra, media_year, item_type))
 
-        # 检查媒体类型匹配
-        # 特殊处理：如果 rule_item_type 是 "series"，则 item_type 为 "series" 或 "tv" 都算匹配
-        if rule_item_type == "series":
-            type_match = (item_type == "series") or (item_type == "tv")
-        else:
-            type_match = (rule_item_type == "all") or (rule_item_type == item_type)
-
-        year_match = True
-        if rule_years: # 规则有年份要求
-            if media_year is not None: # 媒体有年份信息
-                year_match = (media_year in rule_years)
-            else: # 规则有年份要求但媒体没有年份信息，则不匹配
-                year_match = False
-
-        # 收集所有有效的正向匹配结果
-        individual_positive_matches = []
-        if rule_countries:
-            individual_positive_matches.append(country_match)
-        if rule_genre_ids:
-            individual_positive_matches.append(genre_match)
-        if rule_years:
-            individual_positive_matches.append(year_match)
-        # 如果没有定义任何条件，则默认不匹配
-        if not individual_positive_matches:
-            pre_overall_match = False
-        else:
-            # 无论 match_all_conditions 是 True 还是 False，不同条件之间总是“与”关系
-            pre_overall_match = all(individual_positive_matches)
-
-        # --- 根据 is_negative_match 反转初步匹配结果 ---
-        overall_match_excluding_type = pre_overall_match
-        if is_negative_match:
-            overall_match_excluding_type = not pre_overall_match
-
-        # 最终匹配结果：在考虑负向匹配后，还需要满足媒体类型匹配（如果规则定义了媒体类型）
-        # 媒体类型匹配不参与负向匹配的反转
-        overall_match = overall_match_excluding_type
-        if rule_item_type != "all":
-            overall_match = overall_match and type_match
-
-        if overall_match:
-            generated_tags.add(rule["tag"])
-    return list(generated_tags)
+    for rule in rules:
+        tag = rule.tag
+        rule_country_bits = rule.country_bits
+        rule_genre_bits = rule.genre_bits
+        has_countries = rule.has_countries
+        has_genres = rule.has_genres
+        has_years = rule.has_years
+        match_all = rule.match_all
+        year_singles = rule.year_singles
+        year_ranges = rule.year_ranges
+        for i, (country_bits, country_extra, genre_bits, genre_extra, media_year, item_type) in enumerate(prepared):
+            if tag in results[i]:
+                continue
+            # 媒体类型不符时直接排除，不做任何条件运算
+            if not _type_matches(rule.item_type, item_type):
+                continue
+            # 与 _rule_matches 相同的惰性“与”链，只是条件测试走位运算
+            pre_overall_match = has_countries or has_genres or has_years
+            if pre_overall_match and has_countries:
+                if match_all:
+                    # 严格匹配：位集相等且媒体没有位集外的国家
+                    pre_overall_match = (country_bits == rule_country_bits) and not country_extra
+                else:
+                    # 模糊匹配：位集有交集（位与非零）
+                    pre_overall_match = bool(country_bits & rule_country_bits)
+            if pre_overall_match and has_genres:
+                if match_all:
+                    pre_overall_match = (genre_bits == rule_genre_bits) and not genre_extra
+                else:
+                    pre_overall_match = bool(genre_bits & rule_genre_bits)
+            if pre_overall_match and has_years:
+                if media_year is not None:
+                    pre_overall_match = (media_year in year_singles) or \
+                        any(start <= media_year <= end for start, end in year_ranges)
+                else:
+                    pre_overall_match = False
+            overall_match = not pre_overall_match if rule.is_negative else pre_overall_match
+            if overall_match:
+                results[i].add(tag)
+    return [list(tags) for tags in results]
@@ -1,71 +1,177 @@
+import os
 import requests
+from requests.adapters import HTTPAdapter
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional
-from core import config
-from ratelimit import limits, RateLimitException
-from backoff import on_exception, expo
+from core import config, jsonutil
 import time
 
-# 如果 TMDB_RATE_LIMIT_PERIOD 为 0，则不应用限流
+# 模块级共享 Session：复用到 TMDB 的 TCP/TLS 连接，
+# 批量查询时省掉每次约百毫秒的握手开销
+_SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+_SESSION.mount('http://', _adapter)
+_SESSION.mount('https://', _adapter)
+
+class _TokenBucket:
+    """
+    简单的令牌桶限流器：按 time.monotonic 连续补充令牌，
+    acquire() 在有令牌时立即返回，否则睡到下一个令牌就绪。
+    相比 ratelimit+backoff 的"抛异常再指数退避"，热路径上没有
+    异常开销，等待时间也是精确的而不是指数试探。
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate          # 每秒补充的令牌数
+        self.capacity = capacity  # 桶容量（允许的突发量）
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# 请求参数和代理配置来自模块加载时读取的 config，请求间不变，
+# 只构建一次
+_BASE_PARAMS = {
+    'api_key': config.TMDB_API_KEY,
+    'language': 'zh-CN'
+}
+_PROXIES = {
+    "http": config.HTTP_PROXY,
+    "https": config.HTTP_PROXY,
+} if config.HTTP_PROXY else None
+# 防止 TMDB 连接停滞时请求永久挂起
+_REQUEST_TIMEOUT = 10
+
+# TMDB_RATE_LIMIT_PERIOD 为 0 时不限流
+_RATE_BUCKET: Optional[_TokenBucket] = None
 if config.TMDB_RATE_LIMIT_PERIOD > 0:
-    @on_exception(expo, RateLimitException, max_tries=8)
-    @limits(calls=1, period=config.TMDB_RATE_LIMIT_PERIOD)
-    def get_tmdb_details(tmdb_id: str, media_type: str) -> Optional[dict]:
-        """
-        根据 TMDB ID 和媒体类型获取详细信息。
-        media_type: 'movie' 或 'tv'
-        """
-        if not config.TMDB_API_KEY:
-            print("错误：TMDB_API_KEY 未在 config.ini 中设置。")
-            return None
+    _RATE_BUCKET = _TokenBucket(rate=1.0 / config.TMDB_RATE_LIMIT_PERIOD, capacity=1)
 
-        url = f"{config.TMDB_API_BASE_URL}/{media_type}/{tmdb_id}"
-        params = {
-            'api_key': config.TMDB_API_KEY,
-            'language': 'zh-CN'
-        }
-        
-        proxies = {
-            "http": config.HTTP_PROXY,
-            "https": config.HTTP_PROXY,
-        } if config.HTTP_PROXY else None
+def get_tmdb_details(tmdb_id: str, media_type: str) -> Optional[dict]:
+    """
+    根据 TMDB ID 和媒体类型获取详细信息。
+    media_type: 'movie' 或 'tv'
+    """
+    if not config.TMDB_API_KEY:
+        print("错误：TMDB_API_KEY 未在 config.ini 中设置。")
+        return None
+
+    if _RATE_BUCKET is not None:
+        _RATE_BUCKET.acquire()
+
+    url = f"{config.TMDB_API_BASE_URL}/{media_type}/{tmdb_id}"
 
-        try:
-            response = requests.get(url, params=params, proxies=proxies)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"请求 TMDB API 时出错: {e}")
-            if proxies:
-                print(f"当前使用的代理是: {proxies}")
+    try:
+        response = _SESSION.get(url, params=_BASE_PARAMS, proxies=_PROXIES, timeout=_REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        print(f"请求 TMDB API 时出错: {e}")
+        if _PROXIES:
+            print(f"当前使用的代理是: {_PROXIES}")
+        return None
+
+# --- TMDB 详情磁盘缓存 ---
+# TMDB 的媒体详情（国家/类型/年份）很少变动，批量打标签时同一批 ID
+# 每次运行都会重新请求，完全是浪费。这里用标准库 sqlite3 做一个简单的
+# 磁盘缓存，按 (tmdb_id, media_type) 存储响应 JSON，7 天内直接复用，
+# 让重复运行的打标签任务基本不再访问 TMDB 网络接口。
+_CACHE_DB_PATH = "/app/config/tmdb_cache.db"
+_CACHE_TTL_SECONDS = 7 * 24 * 3600
+_cache_conn: Optional[sqlite3.Connection] = None
+_cache_lock = threading.Lock()
+
+def _get_cache_conn() -> sqlite3.Connection:
+    """获取（必要时初始化）缓存数据库连接。调用方需持有 _cache_lock。"""
+    global _cache_conn
+    if _cache_conn is None:
+        os.makedirs(os.path.dirname(_CACHE_DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(_CACHE_DB_PATH, check_same_thread=False)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS tmdb_details ("
+            "tmdb_id TEXT NOT NULL, "
+            "media_type TEXT NOT NULL, "
+            "stored_at REAL NOT NULL, "
+            "body TEXT NOT NULL, "
+            "PRIMARY KEY (tmdb_id, media_type))"
+        )
+        conn.commit()
+        _cache_conn = conn
+    return _cache_conn
+
+def _cache_get(tmdb_id: str, media_type: str) -> Optional[dict]:
+    """从磁盘缓存读取未过期的详情，没有命中返回 None"""
+    try:
+        with _cache_lock:
+            conn = _get_cache_conn()
+            row = conn.execute(
+                "SELECT stored_at, body FROM tmdb_details WHERE tmdb_id = ? AND media_type = ?",
+                (str(tmdb_id), media_type)
+            ).fetchone()
+        if row is None:
             return None
-else:
-    # 不限流版本
-    def get_tmdb_details(tmdb_id: str, media_type: str) -> Optional[dict]:
-        """
-        根据 TMDB ID 和媒体类型获取详细信息。
-        media_type: 'movie' 或 'tv'
-        """
-        if not config.TMDB_API_KEY:
-            print("错误：TMDB_API_KEY 未在 config.ini 中设置。")
+        stored_at, body = row
+        if time.time() - stored_at >= _CACHE_TTL_SECONDS:
             return None
+        return jsonutil.loads(body)
+    except (sqlite3.Error, OSError, ValueError) as e:
+        print(f"读取 TMDB 缓存时出错: {e}")
+        return None
 
-        url = f"{config.TMDB_API_BASE_URL}/{media_type}/{tmdb_id}"
-        params = {
-            'api_key': config.TMDB_API_KEY,
-            'language': 'zh-CN'
-        }
-        
-        proxies = {
-            "http": config.HTTP_PROXY,
-            "https": config.HTTP_PROXY,
-        } if config.HTTP_PROXY else None
+def _cache_put(tmdb_id: str, media_type: str, details: dict):
+    """将详情写入磁盘缓存"""
+    try:
+        with _cache_lock:
+            conn = _get_cache_conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO tmdb_details (tmdb_id, media_type, stored_at, body) VALUES (?, ?, ?, ?)",
+                (str(tmdb_id), media_type, time.time(), jsonutil.dumps(details))
+            )
+            conn.commit()
+    except (sqlite3.Error, OSError) as e:
+        print(f"写入 TMDB 缓存时出错: {e}")
 
-        try:
-            response = requests.get(url, params=params, proxies=proxies)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"请求 TMDB API 时出错: {e}")
-            if proxies:
-                print(f"当前使用的代理是: {proxies}")
-            return None
+def get_tmdb_details_cached(tmdb_id: str, media_type: str) -> Optional[dict]:
+    """
+    get_tmdb_details 的磁盘缓存版本。
+    7 天内的结果直接从本地缓存返回；请求失败（含 404）不会污染缓存。
+    """
+    details = _cache_get(tmdb_id, media_type)
+    if details is not None:
+        return details
+    details = get_tmdb_details(tmdb_id, media_type)
+    if details is not None:
+        _cache_put(tmdb_id, media_type, details)
+    return details
+
+def get_tmdb_details_many(id_type_pairs) -> dict:
+    """
+    并发获取一批 TMDB 详情，入参为 (tmdb_id, media_type) 元组的可迭代对象，
+    返回 {(tmdb_id, media_type): 详情 dict 或 None}。
+    线程池共享模块级 Session 和磁盘缓存；限流仍由 get_tmdb_details
+    上的配置控制，未命中缓存的请求不会超出配置的频率预算。
+    """
+    pairs = list(dict.fromkeys(id_type_pairs)) # 去重并保持顺序
+    results: dict = {}
+    if not pairs:
+        return results
+    with ThreadPoolExecutor(max_workers=min(8, len(pairs))) as executor:
+        future_map = {
+            executor.submit(get_tmdb_details_cached, tmdb_id, media_type): (tmdb_id, media_type)
+            for tmdb_id, media_type in pairs
+        }
+        for future in as_completed(future_map):
+            results[future_map[future]] = future.result()
+    return results